@@ -1,5 +1,6 @@
 import cyclopts
-from pg_man.lib import schema, db
+from pg_man.lib import schema, db, pg
+from pg_man.lib.schema import revisions
 from pg_man import config
 import logging
 import sys
@@ -25,7 +26,9 @@ def upgrade(*, db_url: str | None = None):
     db_url = db_url or settings.db_url
 
     repo = schema.RevisionRepo(
-        settings.revision_dir, dbman_schema=settings.dbman_schema
+        settings.revision_dir,
+        dbman_schema=settings.dbman_schema,
+        managed_schemas=settings.managed_schemas,
     )
     if not repo.revisions:
         print(f"No revision files in directory '{repo.root}'")
@@ -37,7 +40,13 @@ def upgrade(*, db_url: str | None = None):
 
 
 @app.command()
-def revision(name: str, *, autogenerate: bool = True):
+def revision(
+    name: str,
+    *,
+    autogenerate: bool = True,
+    parallel: bool = False,
+    compare_full_dump: bool = False,
+):
     settings = config.get()
     rev_repo = schema.RevisionRepo(
         settings.revision_dir, dbman_schema=settings.dbman_schema
@@ -50,10 +59,94 @@ def revision(name: str, *, autogenerate: bool = True):
 
     ddl_repo = schema.DDLRepo(settings.ddl_dir)
     if autogenerate:
-        content = schema.generate_revision(settings, ddl_repo, rev_repo)
+        content = schema.generate_revision(
+            settings,
+            ddl_repo,
+            rev_repo,
+            parallel=parallel,
+            compare_full_dump=compare_full_dump,
+        )
     else:
         content = ""
 
     rev = rev_repo.add(name, content)
 
     print(f"Created new revision {rev.path}")
+
+
+@app.command()
+def check():
+    settings = config.get()
+    ddl_repo = schema.DDLRepo(settings.ddl_dir)
+
+    with pg.PostgresProcess(settings.postgres_path) as pg_proc:
+        engine = db.connect(pg_proc.url())
+        with engine.connect() as conn:
+            try:
+                ddl_repo.apply(conn, keep_going=True)
+            except schema.DDLApplyError as e:
+                print(e)
+                sys.exit(1)
+        engine.dispose()
+
+    print(f"Applied {len(ddl_repo.files)} DDL file(s)")
+
+
+@app.command()
+def verify(*, checkpoint_interval: int | None = None):
+    settings = config.get()
+    rev_repo = schema.RevisionRepo(
+        settings.revision_dir, dbman_schema=settings.dbman_schema
+    )
+    ddl_repo = schema.DDLRepo(settings.ddl_dir)
+
+    if checkpoint_interval is None:
+        checkpoint_interval = settings.verify_checkpoint_interval
+
+    diff = schema.verify_revisions(
+        settings, ddl_repo, rev_repo, checkpoint_interval=checkpoint_interval
+    )
+    if diff.strip():
+        print("Replaying revisions does not reproduce the DDL schema:")
+        print(diff)
+        sys.exit(1)
+
+    print("Revisions match the DDL schema")
+
+
+@app.command()
+def drift(*, db_url: str | None = None, detail: bool = False):
+    settings = config.get()
+    db_url = db_url or settings.db_url
+
+    if not settings.managed_schemas:
+        print("No managed schemas configured")
+        sys.exit(1)
+
+    with db.connect(db_url).connect() as conn:
+        rev_table = revisions.get_revisions_table(conn, settings.dbman_schema)
+        if rev_table is None:
+            print("Database has no revisions table")
+            sys.exit(1)
+
+        result = schema.check_drift(
+            conn, rev_table, settings.managed_schemas, detail=detail
+        )
+
+    if result.expected is None:
+        print("No schema fingerprint recorded; run 'pgman upgrade' first")
+        sys.exit(1)
+
+    if not result.drifted:
+        print(f"No drift (fingerprint {result.actual})")
+        return
+
+    print(f"Schema drift: expected {result.expected}, found {result.actual}")
+    for key in result.added:
+        print(f"  + {key}")
+    for key in result.removed:
+        print(f"  - {key}")
+    for key in result.changed:
+        print(f"  ~ {key}")
+
+    sys.exit(1)
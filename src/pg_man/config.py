@@ -12,6 +12,8 @@ class Settings(BaseSettings):
     db_url: str
     managed_schemas: set[str] = {"people", "finance"}
     postgres_path: Path = Path("/usr/lib/postgresql/16")
+    verify_cache_dir: Path = Path(".pgman-cache")
+    verify_checkpoint_interval: int = 10
 
     @property
     def ddl_dir(self) -> Path:
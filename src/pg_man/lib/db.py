@@ -1,4 +1,5 @@
 import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from logging import getLogger
 
 logger = getLogger("db-man")
@@ -9,3 +10,10 @@ def connect(db_url: str) -> sa.Engine:
     uri = uri.set(drivername="postgresql+psycopg")
 
     return sa.create_engine(uri, poolclass=sa.NullPool)
+
+
+def connect_async(db_url: str) -> AsyncEngine:
+    uri = sa.make_url(db_url)
+    uri = uri.set(drivername="postgresql+psycopg")
+
+    return create_async_engine(uri, poolclass=sa.NullPool)
@@ -1,13 +1,13 @@
-import re
 import yaml
 from dataclasses import dataclass
 from typing import Any, TextIO
 import io
 
-_FRONT_MATTER_RE = re.compile(
-    r"^\/\*\s*((?P<start>^[-]{3,}$)(?P<front_matter>[\s\S]*)(?P=start))?(?P<doc>[\s\S]*)\*\/",
-    flags=re.MULTILINE,
-)
+_YamlLoader: type[yaml.SafeLoader] | type[yaml.CSafeLoader]
+try:
+    _YamlLoader = yaml.CSafeLoader
+except AttributeError:  # PyYAML built without libyaml
+    _YamlLoader = yaml.SafeLoader
 
 
 @dataclass
@@ -17,20 +17,20 @@ class FrontMatter:
 
     @classmethod
     def parse(cls, sql: str) -> tuple["FrontMatter | None", str]:
-        m = _FRONT_MATTER_RE.search(sql)
-        if not m:
-            return (None, sql)
+        with io.StringIO(sql) as stream:
+            fm, tail = _read_header(stream)
+            if fm is None:
+                return (None, sql)
 
-        if front_matter_yaml := m.group("front_matter"):
-            data = yaml.load(front_matter_yaml, yaml.SafeLoader)
-        else:
-            data = {}
+            return fm, tail + stream.read()
 
-        doc = m.group("doc").strip() or ""
-
-        rest = sql[m.end() :]
+    @classmethod
+    def read(cls, stream: TextIO) -> "FrontMatter | None":
+        """Parse the leading comment block of ``stream``, reading no further
+        than the line holding its closing ``*/``."""
+        fm, _ = _read_header(stream)
 
-        return FrontMatter(data=data, doc=doc), rest
+        return fm
 
     def dump(self, outfile: TextIO) -> None:
         outfile.write("/*\n")
@@ -45,3 +45,48 @@ class FrontMatter:
             self.dump(out)
 
             return out.getvalue()
+
+
+def _read_header(stream: TextIO) -> tuple[FrontMatter | None, str]:
+    """Read a leading ``/* ... */`` block line by line.
+
+    Returns the parsed front matter (``None`` if the stream does not open with
+    a terminated block comment) and the text following ``*/`` on its line.
+    """
+    line = stream.readline()
+    while line and not line.strip():
+        line = stream.readline()
+
+    line = line.lstrip()
+    if not line.startswith("/*"):
+        return None, ""
+
+    line = line[2:]
+    body: list[str] = []
+    while (end := line.find("*/")) == -1:
+        body.append(line)
+        if not (line := stream.readline()):
+            return None, ""
+
+    body.append(line[:end])
+    tail = line[end + 2 :]
+
+    lines = "".join(body).splitlines(keepends=True)
+    start = 0
+    while start < len(lines) and not lines[start].strip():
+        start += 1
+
+    data: dict[str, Any] = {}
+    doc_lines = lines[start:]
+    if start < len(lines) and _is_delimiter(delim := lines[start].strip()):
+        for stop in range(start + 1, len(lines)):
+            if lines[stop].strip() == delim:
+                data = yaml.load("".join(lines[start + 1 : stop]), _YamlLoader) or {}
+                doc_lines = lines[stop + 1 :]
+                break
+
+    return FrontMatter(data=data, doc="".join(doc_lines).strip()), tail
+
+
+def _is_delimiter(line: str) -> bool:
+    return len(line) >= 3 and line == "-" * len(line)
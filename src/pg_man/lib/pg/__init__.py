@@ -1,3 +1,3 @@
-from .subproc import PostgresProcess
+from .subproc import AsyncPostgresProcess, PostgresProcess, TemporaryDatabase
 
-__all__ = ["PostgresProcess"]
+__all__ = ["AsyncPostgresProcess", "PostgresProcess", "TemporaryDatabase"]
@@ -1,3 +1,5 @@
+import asyncio
+import signal
 import subprocess
 import time
 from pathlib import Path
@@ -8,25 +10,19 @@ from uuid import uuid4
 import sqlalchemy
 
 
-class PostgresProcess:
+class _BasePostgresProcess:
     def __init__(
         self,
         postgres_path: Path,
         user: str = "postgres",
+        data_dir: Path | None = None,
     ):
         self.postgres_path = postgres_path
         self.user = user
 
-        self._proc: subprocess.Popen | None = None
+        self._data_dir = data_dir.absolute() if data_dir is not None else None
         self._tmpdir: TemporaryDirectory | None = None
 
-    @property
-    def proc(self) -> subprocess.Popen:
-        if self._proc is None:
-            raise RuntimeError("Not started")
-
-        return self._proc
-
     @property
     def tmpdir(self) -> Path:
         if self._tmpdir is None:
@@ -41,62 +37,111 @@ class PostgresProcess:
     def host(self) -> str:
         return str(self.tmpdir)
 
+    @property
+    def data_dir(self) -> Path:
+        """The cluster's data directory. Unless one was passed in, it lives in
+        :attr:`tmpdir` and is discarded on stop."""
+        if self._data_dir is not None:
+            return self._data_dir
+
+        return self.tmpdir / "data"
+
+    @property
+    def log_path(self) -> Path:
+        """Server output. Written to a file rather than a pipe: nothing drains
+        a pipe, and once its buffer fills the server blocks on logging."""
+        return self.tmpdir / "postgres.log"
+
+    def _needs_initdb(self) -> bool:
+        return not (self.data_dir / "PG_VERSION").exists()
+
+    def _initdb_args(self) -> tuple[str, ...]:
+        return (
+            str(self.postgres_path / "bin" / "initdb"),
+            "-D",
+            str(self.data_dir),
+            "--username",
+            "postgres",
+            "--auth-local",
+            "trust",
+        )
+
+    def _postgres_args(self) -> tuple[str, ...]:
+        return (
+            str(self.postgres_path / "bin" / "postgres"),
+            "-k",
+            str(self.tmpdir),
+            "-D",
+            str(self.data_dir),
+        )
+
+    def _isready_args(self) -> tuple[str, ...]:
+        return (
+            str(self.postgres_path / "bin" / "pg_isready"),
+            "--username",
+            "postgres",
+            "--dbname",
+            "postgres",
+            "-t",
+            str(1),
+            "-h",
+            str(self.tmpdir),
+        )
+
+
+class PostgresProcess(_BasePostgresProcess):
+    def __init__(
+        self,
+        postgres_path: Path,
+        user: str = "postgres",
+        data_dir: Path | None = None,
+    ):
+        super().__init__(postgres_path, user, data_dir)
+
+        self._proc: subprocess.Popen | None = None
+
+    @property
+    def proc(self) -> subprocess.Popen:
+        if self._proc is None:
+            raise RuntimeError("Not started")
+
+        return self._proc
+
     def start(self):
         if self._proc is not None:
             raise RuntimeError("Already started")
 
         self._tmpdir = TemporaryDirectory()
 
-        subprocess.run(
-            (
-                str(self.postgres_path / "bin" / "initdb"),
-                "-D",
-                str(self.tmpdir / "data"),
-                "--username",
-                "postgres",
-                "--auth-local",
-                "trust",
-            ),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-        ).check_returncode()
-
-        self._proc = subprocess.Popen(
-            (
-                str(self.postgres_path / "bin" / "postgres"),
-                "-k",
-                str(self.tmpdir),
-                "-D",
-                str(self.tmpdir / "data"),
-            ),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-        )
+        if self._needs_initdb():
+            subprocess.run(
+                self._initdb_args(),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+            ).check_returncode()
+
+        with open(self.log_path, "wb") as log:
+            self._proc = subprocess.Popen(
+                self._postgres_args(),
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
 
         ready = False
         ttl = 5
         while not ready and ttl > 0:
             ret = subprocess.run(
-                (
-                    str(self.postgres_path / "bin" / "pg_isready"),
-                    "--username",
-                    "postgres",
-                    "--dbname",
-                    "postgres",
-                    "-t",
-                    str(1),
-                    "-h",
-                    str(self.tmpdir),
-                ),
+                self._isready_args(),
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,
             )
             if ret.returncode != 0:
                 ttl -= 1
-                if self._proc.poll():
+                if (returncode := self._proc.poll()) is not None:
+                    output = self.log_path.read_text(errors="replace")
                     self.stop()
                     raise RuntimeError(
-                        f"Failed to start postgres (exit code {self._proc.returncode}): {self._proc.stdout.read()}"
+                        f"Failed to start postgres (exit code {returncode}): {output}"
                     )
                 time.sleep(0.1)
             else:
@@ -110,8 +155,13 @@ class PostgresProcess:
         if self._proc is None:
             return
 
-        self._proc.kill()
-        self._proc.wait(5)
+        if self._data_dir is None:
+            self._proc.kill()
+            self._proc.wait(5)
+        else:
+            # Fast shutdown, so a persistent cluster is left consistent.
+            self._proc.send_signal(signal.SIGINT)
+            self._proc.wait(30)
         self._proc = None
         self._tmpdir.cleanup()
         self._tmpdir = None
@@ -125,6 +175,103 @@ class PostgresProcess:
         self.stop()
 
 
+class AsyncPostgresProcess(_BasePostgresProcess):
+    """:class:`PostgresProcess` driven by :mod:`asyncio` subprocesses, so
+    waiting for the server to come up never blocks the event loop."""
+
+    def __init__(
+        self,
+        postgres_path: Path,
+        user: str = "postgres",
+        data_dir: Path | None = None,
+    ):
+        super().__init__(postgres_path, user, data_dir)
+
+        self._proc: asyncio.subprocess.Process | None = None
+
+    @property
+    def proc(self) -> asyncio.subprocess.Process:
+        if self._proc is None:
+            raise RuntimeError("Not started")
+
+        return self._proc
+
+    async def start(self):
+        if self._proc is not None:
+            raise RuntimeError("Already started")
+
+        self._tmpdir = TemporaryDirectory()
+
+        if self._needs_initdb():
+            initdb = await asyncio.create_subprocess_exec(
+                *self._initdb_args(),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+            )
+            output, _ = await initdb.communicate()
+            if initdb.returncode != 0:
+                self._tmpdir.cleanup()
+                self._tmpdir = None
+                raise subprocess.CalledProcessError(
+                    initdb.returncode, self.postgres_path / "bin" / "initdb", output
+                )
+
+        with open(self.log_path, "wb") as log:
+            self._proc = await asyncio.create_subprocess_exec(
+                *self._postgres_args(),
+                stdout=log,
+                stderr=asyncio.subprocess.STDOUT,
+            )
+
+        ready = False
+        ttl = 5
+        while not ready and ttl > 0:
+            isready = await asyncio.create_subprocess_exec(
+                *self._isready_args(),
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            if await isready.wait() != 0:
+                ttl -= 1
+                if (returncode := self._proc.returncode) is not None:
+                    output = self.log_path.read_text(errors="replace")
+                    await self.stop()
+                    raise RuntimeError(
+                        f"Failed to start postgres (exit code {returncode}): {output}"
+                    )
+                await asyncio.sleep(0.1)
+            else:
+                ready = True
+
+        if not ready:
+            await self.stop()
+            raise RuntimeError("Postgres instance failed to start")
+
+    async def stop(self):
+        if self._proc is None:
+            return
+
+        if self._proc.returncode is None:
+            if self._data_dir is None:
+                self._proc.kill()
+                await asyncio.wait_for(self._proc.wait(), 5)
+            else:
+                # Fast shutdown, so a persistent cluster is left consistent.
+                self._proc.send_signal(signal.SIGINT)
+                await asyncio.wait_for(self._proc.wait(), 30)
+        self._proc = None
+        self._tmpdir.cleanup()
+        self._tmpdir = None
+
+    async def __aenter__(self):
+        await self.start()
+
+        return self
+
+    async def __aexit__(self, *args):
+        await self.stop()
+
+
 class TemporaryDatabase:
     def __init__(
         self,
@@ -155,6 +302,9 @@ class TemporaryDatabase:
         if self.template_name:
             withs += f" TEMPLATE {self.template_name}"
 
+        if self.is_template:
+            withs += " IS_TEMPLATE true"
+
         if withs:
             cmd += f" WITH {withs}"
 
@@ -173,6 +323,10 @@ class TemporaryDatabase:
             AND pid <> pg_backend_pid();
         """)
         )
+        if self.is_template:
+            conn.execute(
+                sqlalchemy.text(f"ALTER DATABASE {self.name} WITH IS_TEMPLATE false")
+            )
         conn.execute(sqlalchemy.text(f"DROP DATABASE {self.name}"))
         conn.close()
         engine.dispose()
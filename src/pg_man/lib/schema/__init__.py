@@ -1,5 +1,18 @@
-from .autogenerate import generate_revision
-from .ddl import DDLRepo
-from .revisions import RevisionRepo, init_revisions_table
+from .autogenerate import generate_revision, generate_revision_async
+from .ddl import DDLApplyError, DDLRepo
+from .fingerprint import check_drift, compute_fingerprint
+from .revisions import AsyncRevisionRepo, RevisionRepo, init_revisions_table
+from .verify import verify_revisions
 
-__all__ = ["DDLRepo", "RevisionRepo", "init_revisions_table", "generate_revision"]
+__all__ = [
+    "DDLRepo",
+    "DDLApplyError",
+    "RevisionRepo",
+    "AsyncRevisionRepo",
+    "init_revisions_table",
+    "generate_revision",
+    "generate_revision_async",
+    "verify_revisions",
+    "check_drift",
+    "compute_fingerprint",
+]
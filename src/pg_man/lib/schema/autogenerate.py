@@ -1,18 +1,96 @@
 from pg_man.lib import db, pg
 from pg_man.lib.schema import ddl, revisions
 from pg_man.config import Settings
+from collections.abc import Callable, Collection, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, TypeVar
+import asyncio
+import logging
 import tempfile
 import subprocess
+import time
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
 from pathlib import Path
 
+logger = logging.getLogger("dbman.autogenerate")
+
+_T = TypeVar("_T")
+
+# Objects living in a managed schema, keyed the way pg_depend refers to them.
+# Rules, defaults and triggers have no namespace of their own and take their
+# relation's. Joining pg_depend against this on both sides keeps the check
+# proportional to the managed schemas rather than the whole database.
+_CROSS_SCHEMA_DEPS_SQL = sa.text("""
+WITH managed AS (
+    SELECT oid, nspname FROM pg_namespace WHERE nspname = ANY(:schemas)
+),
+objects (classid, objid, nspname) AS (
+    SELECT 'pg_class'::regclass::oid, c.oid, m.nspname
+    FROM pg_class c
+    JOIN managed m ON m.oid = c.relnamespace
+    UNION ALL
+    SELECT 'pg_type'::regclass::oid, t.oid, m.nspname
+    FROM pg_type t
+    JOIN managed m ON m.oid = t.typnamespace
+    UNION ALL
+    SELECT 'pg_proc'::regclass::oid, p.oid, m.nspname
+    FROM pg_proc p
+    JOIN managed m ON m.oid = p.pronamespace
+    UNION ALL
+    SELECT 'pg_constraint'::regclass::oid, con.oid, m.nspname
+    FROM pg_constraint con
+    JOIN managed m ON m.oid = con.connamespace
+    UNION ALL
+    SELECT 'pg_rewrite'::regclass::oid, rw.oid, m.nspname
+    FROM pg_rewrite rw
+    JOIN pg_class c ON c.oid = rw.ev_class
+    JOIN managed m ON m.oid = c.relnamespace
+    UNION ALL
+    SELECT 'pg_attrdef'::regclass::oid, ad.oid, m.nspname
+    FROM pg_attrdef ad
+    JOIN pg_class c ON c.oid = ad.adrelid
+    JOIN managed m ON m.oid = c.relnamespace
+    UNION ALL
+    SELECT 'pg_trigger'::regclass::oid, tg.oid, m.nspname
+    FROM pg_trigger tg
+    JOIN pg_class c ON c.oid = tg.tgrelid
+    JOIN managed m ON m.oid = c.relnamespace
+)
+SELECT EXISTS (
+    SELECT 1
+    FROM pg_depend d
+    JOIN objects o ON o.classid = d.classid AND o.objid = d.objid
+    JOIN objects r ON r.classid = d.refclassid AND r.objid = d.refobjid
+    WHERE d.deptype IN ('n', 'a') AND o.nspname <> r.nspname
+)
+""")
+
 
 def generate_revision(
-    settings: Settings, ddl_repo: ddl.DDLRepo, revisions_repo: revisions.RevisionRepo
+    settings: Settings,
+    ddl_repo: ddl.DDLRepo,
+    revisions_repo: revisions.RevisionRepo,
+    *,
+    parallel: bool = False,
+    compare_full_dump: bool = False,
 ) -> str:
+    """Diff the live database against a shadow database built from ``ddl_repo``.
+
+    Only ``settings.managed_schemas`` are dumped (every schema but
+    ``settings.dbman_schema`` if none are configured). With ``parallel``, each
+    schema is dumped and diffed concurrently and the per-schema DDL is
+    concatenated in schema-name order. That order is only valid for
+    independent schemas, so if objects in one managed schema depend on
+    another in either database, all of them are diffed together instead.
+    With ``compare_full_dump``, the unscoped dumps and diff are also run so
+    the time saved by scoping is logged.
+    """
     db_engine = db.connect(settings.db_url)
-    conn = db_engine.connect()
+    with db_engine.connect() as conn:
+        curr_revision = revisions_repo.get_current_revision(conn)
+    db_engine.dispose()
 
-    curr_revision = revisions_repo.get_current_revision(conn)
     if curr_revision != revisions_repo.head:
         raise RuntimeError("Database not up to date")
 
@@ -27,44 +105,313 @@ def generate_revision(
 
         ddl_db_engine.dispose()
 
-        current_path = Path(tmpdir, "current.sql")
-        upgrade_path = Path(tmpdir, "upgrade.sql")
-        subprocess.run(
-            [
-                "pg_dump",
-                "--no-owner",
-                "--schema-only",
-                "--exclude-schema",
-                settings.dbman_schema,
-                "--file",
-                str(current_path),
-                settings.db_url,
-            ]
-        ).check_returncode()
-        subprocess.run(
-            [
-                "pg_dump",
-                "--no-owner",
-                "--schema-only",
-                "--exclude-schema",
-                settings.dbman_schema,
-                "--file",
-                str(upgrade_path),
-                pg_proc.url(),
+        plan = _DiffPlan(settings, Path(tmpdir), pg_proc.url(), parallel=parallel)
+
+        started = time.perf_counter()
+        if plan.parallel and any(
+            _query(url, plan.has_cross_schema_deps) for url in plan.urls
+        ):
+            plan.diff_together()
+
+        with ThreadPoolExecutor() as executor:
+            diffs = list(
+                executor.map(lambda job: diff_databases(settings, *job), plan.jobs)
+            )
+        result = plan.merge(diffs, time.perf_counter() - started)
+
+        if compare_full_dump:
+            started = time.perf_counter()
+            diff_databases(settings, *plan.full_job)
+            plan.log_full_timing(time.perf_counter() - started)
+
+        return result
+
+
+async def generate_revision_async(
+    settings: Settings,
+    ddl_repo: ddl.DDLRepo,
+    revisions_repo: revisions.AsyncRevisionRepo,
+    *,
+    parallel: bool = False,
+    compare_full_dump: bool = False,
+) -> str:
+    """:func:`generate_revision` for asyncio, with ``pg_dump`` and apgdiff run as
+    asyncio subprocesses and parallel per-schema diffs gathered on the loop."""
+    db_engine = db.connect_async(settings.db_url)
+    async with db_engine.connect() as conn:
+        curr_revision = await revisions_repo.get_current_revision(conn)
+    await db_engine.dispose()
+
+    if curr_revision != revisions_repo.head:
+        raise RuntimeError("Database not up to date")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        async with pg.AsyncPostgresProcess(settings.postgres_path) as pg_proc:
+            ddl_db_engine = db.connect_async(pg_proc.url())
+            async with ddl_db_engine.connect() as conn:
+                await conn.run_sync(ddl_repo.apply)
+                await conn.commit()
+
+            await ddl_db_engine.dispose()
+
+            plan = _DiffPlan(settings, Path(tmpdir), pg_proc.url(), parallel=parallel)
+
+            started = time.perf_counter()
+            if plan.parallel and any(
+                await asyncio.gather(
+                    *(
+                        _query_async(url, plan.has_cross_schema_deps)
+                        for url in plan.urls
+                    )
+                )
+            ):
+                plan.diff_together()
+
+            diffs = await asyncio.gather(
+                *(_diff_databases_async(settings, *job) for job in plan.jobs)
+            )
+            result = plan.merge(diffs, time.perf_counter() - started)
+
+            if compare_full_dump:
+                started = time.perf_counter()
+                await _diff_databases_async(settings, *plan.full_job)
+                plan.log_full_timing(time.perf_counter() - started)
+
+            return result
+
+
+def dump_schema(
+    db_url: str,
+    outfile: Path,
+    schemas: Collection[str] | None = None,
+    *,
+    exclude_schemas: Collection[str] = (),
+) -> None:
+    """Write a schema-only ``pg_dump`` of ``db_url`` to ``outfile``.
+
+    If ``schemas`` is given, the dump is restricted to those schemas that exist
+    in the database (``pg_dump`` refuses a ``--schema`` filter matching nothing).
+    """
+    if schemas is not None:
+        schemas = existing_schemas(db_url, schemas)
+
+    if (args := _pg_dump_args(db_url, outfile, schemas, exclude_schemas)) is None:
+        outfile.write_text("")
+    else:
+        _run(args)
+
+
+def existing_schemas(db_url: str, schemas: Collection[str]) -> list[str]:
+    """Return the subset of ``schemas`` present in the database, sorted by name."""
+    return sorted(_query(db_url, _schema_names).intersection(schemas))
+
+
+def diff_schemas(settings: Settings, current_path: Path, upgrade_path: Path) -> str:
+    """Return the apgdiff DDL migrating ``current_path`` to ``upgrade_path``."""
+    return _run(_apgdiff_args(settings, current_path, upgrade_path)).decode()
+
+
+def diff_databases(
+    settings: Settings,
+    current_url: str,
+    upgrade_url: str,
+    dump_dir: Path,
+    schemas: Collection[str] | None,
+) -> str:
+    """Dump ``schemas`` of both databases into ``dump_dir`` and return the
+    apgdiff DDL migrating ``current_url`` to ``upgrade_url``."""
+    current_path, upgrade_path = _dump_paths(dump_dir)
+
+    exclude = [settings.dbman_schema]
+    dump_schema(current_url, current_path, schemas, exclude_schemas=exclude)
+    dump_schema(upgrade_url, upgrade_path, schemas, exclude_schemas=exclude)
+
+    return diff_schemas(settings, current_path, upgrade_path)
+
+
+class _DiffJob(NamedTuple):
+    current_url: str
+    upgrade_url: str
+    dump_dir: Path
+    schemas: Collection[str] | None
+
+
+class _DiffPlan:
+    """Which dumps and diffs a revision is generated from, how their output is
+    merged and timed; shared by the sync and asyncio entry points."""
+
+    def __init__(
+        self, settings: Settings, workdir: Path, shadow_url: str, *, parallel: bool
+    ):
+        self.schemas = sorted(settings.managed_schemas) or None
+        self.urls = (settings.db_url, shadow_url)
+        self.parallel = parallel and self.schemas is not None and len(self.schemas) > 1
+        self.full_job = _DiffJob(*self.urls, workdir / "full", None)
+
+        self._workdir = workdir
+        self._scoped_elapsed = 0.0
+
+    @property
+    def jobs(self) -> list[_DiffJob]:
+        if self.parallel and self.schemas:
+            return [
+                _DiffJob(*self.urls, self._workdir / schema, [schema])
+                for schema in self.schemas
             ]
-        ).check_returncode()
-
-        result = subprocess.run(
-            [
-                "java",
-                "-jar",
-                settings.apgdiff_jar_path,
-                str(current_path),
-                str(upgrade_path),
-            ],
-            stdout=subprocess.PIPE,
-            text=True,
+
+        return [_DiffJob(*self.urls, self._workdir / "scoped", self.schemas)]
+
+    def has_cross_schema_deps(self, conn: sa.Connection) -> bool:
+        """Whether an object in one managed schema depends on one in another,
+        in which case per-schema diffs can't simply be concatenated."""
+        return bool(
+            conn.execute(
+                _CROSS_SCHEMA_DEPS_SQL.bindparams(
+                    sa.bindparam("schemas", type_=postgresql.ARRAY(sa.TEXT()))
+                ),
+                {"schemas": self.schemas},
+            ).scalar()
+        )
+
+    def diff_together(self):
+        logger.info("Managed schemas depend on each other; diffing them together")
+        self.parallel = False
+
+    def merge(self, diffs: Sequence[str], elapsed: float) -> str:
+        self._scoped_elapsed = elapsed
+        logger.info(
+            "Dumped and diffed %s in %.2fs",
+            f"schemas {', '.join(self.schemas)}" if self.schemas else "all schemas",
+            elapsed,
         )
-        result.check_returncode()
 
-        return result.stdout
+        return "".join(diffs)
+
+    def log_full_timing(self, full_elapsed: float):
+        logger.info(
+            "Unscoped dumps and diff took %.2fs; scoping saved %.2fs",
+            full_elapsed,
+            full_elapsed - self._scoped_elapsed,
+        )
+
+
+async def _dump_schema_async(
+    db_url: str,
+    outfile: Path,
+    schemas: Collection[str] | None = None,
+    *,
+    exclude_schemas: Collection[str] = (),
+) -> None:
+    if schemas is not None:
+        present = await _query_async(db_url, _schema_names)
+        schemas = sorted(present.intersection(schemas))
+
+    if (args := _pg_dump_args(db_url, outfile, schemas, exclude_schemas)) is None:
+        outfile.write_text("")
+    else:
+        await _run_async(args)
+
+
+async def _diff_databases_async(
+    settings: Settings,
+    current_url: str,
+    upgrade_url: str,
+    dump_dir: Path,
+    schemas: Collection[str] | None,
+) -> str:
+    current_path, upgrade_path = _dump_paths(dump_dir)
+
+    exclude = [settings.dbman_schema]
+    await asyncio.gather(
+        _dump_schema_async(current_url, current_path, schemas, exclude_schemas=exclude),
+        _dump_schema_async(upgrade_url, upgrade_path, schemas, exclude_schemas=exclude),
+    )
+
+    out = await _run_async(_apgdiff_args(settings, current_path, upgrade_path))
+
+    return out.decode()
+
+
+def _query(db_url: str, fn: Callable[[sa.Connection], _T]) -> _T:
+    engine = db.connect(db_url)
+    with engine.connect() as conn:
+        result = fn(conn)
+    engine.dispose()
+
+    return result
+
+
+async def _query_async(db_url: str, fn: Callable[[sa.Connection], _T]) -> _T:
+    engine = db.connect_async(db_url)
+    async with engine.connect() as conn:
+        result = await conn.run_sync(fn)
+    await engine.dispose()
+
+    return result
+
+
+def _schema_names(conn: sa.Connection) -> set[str]:
+    return set(sa.inspect(conn).get_schema_names())
+
+
+def _dump_paths(dump_dir: Path) -> tuple[Path, Path]:
+    dump_dir.mkdir(parents=True, exist_ok=True)
+
+    return dump_dir / "current.sql", dump_dir / "upgrade.sql"
+
+
+def _pg_dump_args(
+    db_url: str,
+    outfile: Path,
+    schemas: Collection[str] | None,
+    exclude_schemas: Collection[str],
+) -> list[str] | None:
+    """Command line for a schema-only dump, or ``None`` if ``schemas`` is empty
+    and there is nothing to dump."""
+    if schemas is not None and not schemas:
+        return None
+
+    args = ["pg_dump", "--no-owner", "--schema-only", "--file", str(outfile)]
+
+    for schema in schemas or ():
+        args.extend(("--schema", _exact_pattern(schema)))
+
+    for schema in exclude_schemas:
+        args.extend(("--exclude-schema", _exact_pattern(schema)))
+
+    args.append(db_url)
+
+    return args
+
+
+def _exact_pattern(name: str) -> str:
+    # pg_dump takes psql patterns; quoting disables case folding and wildcards.
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _apgdiff_args(
+    settings: Settings, current_path: Path, upgrade_path: Path
+) -> list[str]:
+    return [
+        "java",
+        "-jar",
+        str(settings.apgdiff_jar_path),
+        str(current_path),
+        str(upgrade_path),
+    ]
+
+
+def _run(args: list[str]) -> bytes:
+    result = subprocess.run(args, stdout=subprocess.PIPE)
+    result.check_returncode()
+
+    return result.stdout
+
+
+async def _run_async(args: list[str]) -> bytes:
+    proc = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE)
+    out, _ = await proc.communicate()
+    if (returncode := await proc.wait()) != 0:
+        raise subprocess.CalledProcessError(returncode, args, out)
+
+    return out
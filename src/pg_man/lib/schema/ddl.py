@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import PurePosixPath, Path
 from typing import TypeAlias
 from collections.abc import Mapping
@@ -43,6 +43,36 @@ class DDLFile:
         return hash(self.path)
 
 
+@dataclass
+class DDLFailure:
+    file: DDLFile
+    error: sa.exc.DBAPIError
+    line: int | None = None
+    skipped: list[DDLFile] = field(default_factory=list)
+
+    @property
+    def message(self) -> str:
+        return str(self.error.orig).strip().partition("\n")[0]
+
+
+class DDLApplyError(RuntimeError):
+    failures: list[DDLFailure]
+
+    def __init__(self, failures: list[DDLFailure]):
+        self.failures = failures
+
+        lines = [f"{len(failures)} DDL file(s) failed to apply:"]
+        for failure in failures:
+            location = str(failure.file.path)
+            if failure.line is not None:
+                location += f":{failure.line}"
+            lines.append(f"  {location}: {failure.message}")
+            for skipped in failure.skipped:
+                lines.append(f"    skipped dependent {skipped.path}")
+
+        super().__init__("\n".join(lines))
+
+
 class DDLRepo:
     root: Path
 
@@ -67,9 +97,49 @@ class DDLRepo:
 
         yield from self._topological_order
 
-    def apply(self, conn: sa.Connection):
+    def apply(self, conn: sa.Connection, *, keep_going: bool = False):
+        """Execute every file in dependency order.
+
+        By default the first failure propagates. With ``keep_going``, each file
+        runs in a savepoint; a failing file is rolled back and only the files
+        that transitively depend on it are skipped. Every failure is then
+        reported together in a :class:`DDLApplyError`.
+        """
+        if not keep_going:
+            for ddl in self.topological_order:
+                conn.execute(sa.text(ddl.content))
+
+            return
+
+        failures: dict[DDLFile, DDLFailure] = {}
+        # Failed files each skipped file is (transitively) waiting on.
+        blocked_by: dict[DDLFile, set[DDLFile]] = {}
+
         for ddl in self.topological_order:
-            conn.execute(sa.text(ddl.content))
+            causes: set[DDLFile] = set()
+            for dep in ddl.depends_on:
+                if dep in failures:
+                    causes.add(dep)
+                causes.update(blocked_by.get(dep, ()))
+
+            if causes:
+                blocked_by[ddl] = causes
+                for cause in causes:
+                    failures[cause].skipped.append(ddl)
+                continue
+
+            savepoint = conn.begin_nested()
+            try:
+                conn.execute(sa.text(ddl.content))
+            except sa.exc.DBAPIError as e:
+                savepoint.rollback()
+                failures[ddl] = DDLFailure(file=ddl, error=e, line=_error_line(ddl, e))
+                logger.warning("Failed to apply %s", ddl.path)
+            else:
+                savepoint.commit()
+
+        if failures:
+            raise DDLApplyError(list(failures.values()))
 
     def _load_one(self, real_path: Path) -> DDLFile:
         real_path = real_path.resolve()
@@ -79,9 +149,7 @@ class DDLRepo:
         self._topological_order = None
 
         with open(real_path, "r") as f:
-            sql = f.read()
-
-        fm, _ = FrontMatter.parse(sql)
+            fm = FrontMatter.read(f)
         if fm is None:
             config = DDLFileConfig()
             doc = ""
@@ -112,3 +180,14 @@ class DDLRepo:
         self._files[real_path] = ddl_file
 
         return ddl_file
+
+
+def _error_line(ddl: DDLFile, error: sa.exc.DBAPIError) -> int | None:
+    diag = getattr(error.orig, "diag", None)
+    if diag is None or not diag.statement_position:
+        return None
+
+    # statement_position is a 1-based character offset into the file content.
+    position = int(diag.statement_position)
+
+    return ddl.content.count("\n", 0, position - 1) + 1
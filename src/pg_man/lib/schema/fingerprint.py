@@ -0,0 +1,274 @@
+from dataclasses import dataclass, field
+from collections.abc import Collection, Iterator, Mapping
+from contextlib import contextmanager
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# One row per schema object as (kind, ident, definition). Definitions come from
+# the catalog's own deparsers, so they are stable for an unchanged object.
+_OBJECTS_SQL = """
+SELECT 'schema' AS kind, n.nspname AS ident, '' AS definition
+FROM pg_namespace n
+WHERE n.nspname = ANY(:schemas)
+UNION ALL
+SELECT
+    'relation',
+    n.nspname || '.' || c.relname,
+    concat_ws(
+        ' ',
+        c.relkind::text,
+        c.relpersistence::text,
+        CASE WHEN c.relkind IN ('v', 'm') THEN pg_get_viewdef(c.oid) END
+    )
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = ANY(:schemas) AND c.relkind IN ('r', 'p', 'v', 'm', 'S', 'f', 'c')
+UNION ALL
+SELECT
+    'column',
+    n.nspname || '.' || c.relname || '.' || a.attname,
+    concat_ws(
+        ' ',
+        format_type(a.atttypid, a.atttypmod),
+        CASE WHEN a.attnotnull THEN 'NOT NULL' END,
+        'DEFAULT ' || pg_get_expr(d.adbin, d.adrelid),
+        nullif(a.attidentity::text, ''),
+        nullif(a.attgenerated::text, '')
+    )
+FROM pg_attribute a
+JOIN pg_class c ON c.oid = a.attrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+WHERE n.nspname = ANY(:schemas)
+    AND c.relkind IN ('r', 'p', 'v', 'm', 'f', 'c')
+    AND a.attnum > 0
+    AND NOT a.attisdropped
+UNION ALL
+SELECT
+    'sequence',
+    n.nspname || '.' || c.relname,
+    concat_ws(
+        ' ',
+        format_type(s.seqtypid, NULL),
+        s.seqstart,
+        s.seqincrement,
+        s.seqmin,
+        s.seqmax,
+        s.seqcache,
+        s.seqcycle
+    )
+FROM pg_sequence s
+JOIN pg_class c ON c.oid = s.seqrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = ANY(:schemas)
+UNION ALL
+SELECT
+    'constraint',
+    n.nspname || '.' || coalesce(c.relname, t.typname) || '.' || con.conname,
+    pg_get_constraintdef(con.oid)
+FROM pg_constraint con
+JOIN pg_namespace n ON n.oid = con.connamespace
+LEFT JOIN pg_class c ON c.oid = con.conrelid
+LEFT JOIN pg_type t ON t.oid = con.contypid
+WHERE n.nspname = ANY(:schemas)
+UNION ALL
+SELECT 'index', n.nspname || '.' || c.relname, pg_get_indexdef(i.indexrelid)
+FROM pg_index i
+JOIN pg_class c ON c.oid = i.indexrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = ANY(:schemas)
+UNION ALL
+SELECT
+    'trigger',
+    n.nspname || '.' || c.relname || '.' || tg.tgname,
+    pg_get_triggerdef(tg.oid)
+FROM pg_trigger tg
+JOIN pg_class c ON c.oid = tg.tgrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = ANY(:schemas) AND NOT tg.tgisinternal
+UNION ALL
+SELECT
+    'policy',
+    n.nspname || '.' || c.relname || '.' || pol.polname,
+    concat_ws(
+        ' ',
+        pol.polcmd::text,
+        pol.polpermissive,
+        pg_get_expr(pol.polqual, pol.polrelid),
+        pg_get_expr(pol.polwithcheck, pol.polrelid)
+    )
+FROM pg_policy pol
+JOIN pg_class c ON c.oid = pol.polrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = ANY(:schemas)
+UNION ALL
+SELECT
+    'function',
+    n.nspname || '.' || p.proname
+        || '(' || pg_get_function_identity_arguments(p.oid) || ')',
+    CASE
+        WHEN p.prokind IN ('f', 'p') THEN pg_get_functiondef(p.oid)
+        ELSE p.prokind::text || ' ' || pg_get_function_result(p.oid)
+    END
+FROM pg_proc p
+JOIN pg_namespace n ON n.oid = p.pronamespace
+WHERE n.nspname = ANY(:schemas)
+UNION ALL
+SELECT
+    'type',
+    n.nspname || '.' || t.typname,
+    concat_ws(
+        ' ',
+        t.typtype::text,
+        CASE t.typtype
+            WHEN 'e' THEN (
+                SELECT string_agg(e.enumlabel, ',' ORDER BY e.enumsortorder)
+                FROM pg_enum e
+                WHERE e.enumtypid = t.oid
+            )
+            WHEN 'd' THEN format_type(t.typbasetype, t.typtypmod)
+        END,
+        CASE WHEN t.typnotnull THEN 'NOT NULL' END,
+        'DEFAULT ' || t.typdefault
+    )
+FROM pg_type t
+JOIN pg_namespace n ON n.oid = t.typnamespace
+WHERE n.nspname = ANY(:schemas) AND t.typtype IN ('e', 'd', 'r', 'm')
+"""
+
+_FINGERPRINT_SQL = f"""
+WITH objects AS ({_OBJECTS_SQL}),
+hashed AS (
+    SELECT kind || ' ' || ident AS key, md5(coalesce(definition, '')) AS hash
+    FROM objects
+)
+SELECT
+    md5(coalesce(
+        string_agg(key || ' ' || hash, E'\\n' ORDER BY key COLLATE "C"), ''
+    )) AS digest,
+    {{objects}} AS objects
+FROM hashed
+"""
+
+_OBJECTS_AGG = "coalesce(jsonb_object_agg(key, hash), '{}'::jsonb)"
+
+
+@dataclass(frozen=True)
+class Fingerprint:
+    """Digest of the catalog definitions of every object in a set of schemas.
+
+    ``objects`` maps ``"<kind> <schema>.<name>"`` to the hash of that object's
+    definition, so two fingerprints can be compared object by object.
+    """
+
+    digest: str
+    objects: Mapping[str, str] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class Drift:
+    expected: str | None
+    actual: str
+    added: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    changed: list[str] = field(default_factory=list)
+
+    @property
+    def drifted(self) -> bool:
+        return self.expected != self.actual
+
+
+def compute_fingerprint(conn: sa.Connection, schemas: Collection[str]) -> Fingerprint:
+    with _pinned_search_path(conn):
+        row = conn.execute(
+            _fingerprint_query(objects=True), {"schemas": sorted(schemas)}
+        ).one()
+
+    return Fingerprint(digest=row.digest, objects=row.objects)
+
+
+def check_drift(
+    conn: sa.Connection,
+    revisions_table: sa.Table,
+    schemas: Collection[str],
+    *,
+    detail: bool = False,
+) -> Drift:
+    """Recompute the fingerprint of ``schemas`` and compare it with the one
+    recorded for the latest revision, in a single query.
+
+    With ``detail``, per-object hashes are compared as well to list the objects
+    that were added, removed or changed since that revision was applied.
+    """
+    columns = sa.inspect(conn).get_columns(
+        revisions_table.name, schema=revisions_table.schema
+    )
+    if "schema_fingerprint" not in {c["name"] for c in columns}:
+        # Table predates fingerprints and has not been upgraded since.
+        fp = compute_fingerprint(conn, schemas)
+        return Drift(expected=None, actual=fp.digest)
+
+    query = sa.text(f"""
+        WITH fingerprint AS ({_fingerprint_query(objects=detail).text}),
+        stored AS (
+            SELECT schema_fingerprint, schema_objects
+            FROM {revisions_table.fullname}
+            ORDER BY index DESC
+            LIMIT 1
+        )
+        SELECT
+            fingerprint.digest AS actual,
+            stored.schema_fingerprint AS expected,
+            fingerprint.objects AS actual_objects,
+            {"stored.schema_objects" if detail else "NULL"} AS expected_objects
+        FROM fingerprint
+        LEFT JOIN stored ON true
+    """).bindparams(_schemas_param())
+
+    with _pinned_search_path(conn):
+        row = conn.execute(query, {"schemas": sorted(schemas)}).one()
+
+    if not detail or row.expected_objects is None:
+        return Drift(expected=row.expected, actual=row.actual)
+
+    actual: Mapping[str, str] = row.actual_objects
+    expected: Mapping[str, str] = row.expected_objects
+
+    return Drift(
+        expected=row.expected,
+        actual=row.actual,
+        added=sorted(actual.keys() - expected.keys()),
+        removed=sorted(expected.keys() - actual.keys()),
+        changed=sorted(
+            key
+            for key in actual.keys() & expected.keys()
+            if actual[key] != expected[key]
+        ),
+    )
+
+
+@contextmanager
+def _pinned_search_path(conn: sa.Connection) -> Iterator[None]:
+    """Run with ``search_path`` set to ``pg_catalog`` only.
+
+    The deparse functions qualify names relative to ``search_path``, and
+    revisions generated by apgdiff change it, so the upgrade connection and a
+    fresh one would otherwise fingerprint the same schema differently. The
+    setting is local to a savepoint that is rolled back afterwards.
+    """
+    savepoint = conn.begin_nested()
+    try:
+        conn.execute(sa.text("SELECT set_config('search_path', 'pg_catalog', true)"))
+        yield
+    finally:
+        savepoint.rollback()
+
+
+def _fingerprint_query(objects: bool) -> sa.TextClause:
+    return sa.text(
+        _FINGERPRINT_SQL.format(objects=_OBJECTS_AGG if objects else "NULL")
+    ).bindparams(_schemas_param())
+
+
+def _schemas_param() -> sa.BindParameter:
+    return sa.bindparam("schemas", type_=postgresql.ARRAY(sa.TEXT()))
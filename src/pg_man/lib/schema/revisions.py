@@ -1,12 +1,15 @@
 from dataclasses import dataclass
 from pathlib import Path
-from collections.abc import Sequence, Mapping
+from collections.abc import Collection, Sequence, Mapping
 from contextlib import contextmanager
 import parse
 import functools
 import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncConnection
 import logging
 from pg_man.lib.uid import short_uid
+from pg_man.lib.schema import fingerprint
 
 logger = logging.getLogger("db_man.revisions")
 
@@ -42,12 +45,18 @@ class Revision:
         return (self.index, self.uid) == (other.index, other.uid)
 
 
-class RevisionRepo:
+class _BaseRevisionRepo:
     root: Path
 
-    def __init__(self, root: Path, dbman_schema: str):
+    def __init__(
+        self,
+        root: Path,
+        dbman_schema: str,
+        managed_schemas: Collection[str] | None = None,
+    ):
         self.root = root
         self.dbman_schema = dbman_schema
+        self.managed_schemas = managed_schemas
         self._revisions: list[Revision] = []
         self._revisions_by_name: dict[str, Revision] = {}
 
@@ -112,21 +121,30 @@ class RevisionRepo:
 
         return None
 
-    def upgrade_db(self, conn: sa.Connection):
+    def _upgrade_db(self, conn: sa.Connection, target: Revision | None = None):
         if (revisions_table := get_revisions_table(conn, self.dbman_schema)) is None:
             revisions_table = init_revisions_table(conn, dbman_schema=self.dbman_schema)
+        else:
+            _add_fingerprint_columns(conn, revisions_table)
 
-        curr = self.get_current_revision(conn)
+        curr = self._get_current_revision(conn)
         if curr is None:
             index = 0
         else:
             index = curr.index + 1
 
-        for rev in self.revisions[index:]:
+        stop = len(self.revisions) if target is None else target.index + 1
+        applied = self.revisions[index:stop]
+        for rev in applied:
             apply_revision(conn, revisions_table, rev)
             logger.info("Applied revision %s", rev.path.name)
 
-    def get_current_revision(self, conn: sa.Connection) -> Revision | None:
+        if self.managed_schemas and (
+            applied or _head_fingerprint_missing(conn, revisions_table)
+        ):
+            _record_fingerprint(conn, revisions_table, self.managed_schemas)
+
+    def _get_current_revision(self, conn: sa.Connection) -> Revision | None:
         rev_table = _get_revisions_table_if_exists(conn, self.dbman_schema)
 
         if rev_table is None:
@@ -143,6 +161,28 @@ class RevisionRepo:
         return self.revisions[index]
 
 
+class RevisionRepo(_BaseRevisionRepo):
+    def upgrade_db(self, conn: sa.Connection, target: Revision | None = None):
+        self._upgrade_db(conn, target)
+
+    def get_current_revision(self, conn: sa.Connection) -> Revision | None:
+        return self._get_current_revision(conn)
+
+
+class AsyncRevisionRepo(_BaseRevisionRepo):
+    """:class:`RevisionRepo` for :class:`~sqlalchemy.ext.asyncio.AsyncConnection`.
+
+    Queries run through ``AsyncConnection.run_sync`` on the async psycopg
+    driver, so they suspend on I/O instead of blocking the event loop.
+    """
+
+    async def upgrade_db(self, conn: AsyncConnection, target: Revision | None = None):
+        await conn.run_sync(self._upgrade_db, target)
+
+    async def get_current_revision(self, conn: AsyncConnection) -> Revision | None:
+        return await conn.run_sync(self._get_current_revision)
+
+
 def get_revisions_table(conn: sa.Connection, dbman_schema: str) -> sa.Table | None:
     if not conn.dialect.has_table(
         conn, _revisions_table(dbman_schema).name, schema=dbman_schema
@@ -201,6 +241,48 @@ def _get_revisions_table_if_exists(
     return None
 
 
+def _add_fingerprint_columns(conn: sa.Connection, revisions_table: sa.Table):
+    # Revisions tables created before fingerprints were recorded lack these.
+    # Check first: the ALTER locks the table even when there is nothing to add.
+    columns = sa.inspect(conn).get_columns(
+        revisions_table.name, schema=revisions_table.schema
+    )
+    if "schema_fingerprint" in {c["name"] for c in columns}:
+        return
+
+    conn.execute(
+        sa.text(f"""
+        ALTER TABLE {revisions_table.fullname}
+        ADD COLUMN IF NOT EXISTS schema_fingerprint TEXT,
+        ADD COLUMN IF NOT EXISTS schema_objects JSONB
+    """)
+    )
+
+
+def _head_fingerprint_missing(conn: sa.Connection, revisions_table: sa.Table) -> bool:
+    # False when there are no rows at all: there is no head to fingerprint.
+    head = conn.execute(
+        sa.select(revisions_table.c.index, revisions_table.c.schema_fingerprint)
+        .order_by(revisions_table.c.index.desc())
+        .limit(1)
+    ).one_or_none()
+
+    return head is not None and head.schema_fingerprint is None
+
+
+def _record_fingerprint(
+    conn: sa.Connection, revisions_table: sa.Table, schemas: Collection[str]
+):
+    """Store the current schema fingerprint on the head revision's row."""
+    fp = fingerprint.compute_fingerprint(conn, schemas)
+    head_index = sa.select(sa.func.max(revisions_table.c.index)).scalar_subquery()
+    conn.execute(
+        sa.update(revisions_table)
+        .where(revisions_table.c.index == head_index)
+        .values(schema_fingerprint=fp.digest, schema_objects=fp.objects)
+    )
+
+
 @functools.cache
 def _revision_filename_parser() -> parse.Parser:
     return parse.compile(REVISION_FILENAME_FMT)
@@ -216,4 +298,6 @@ def _revisions_table(dbman_schema: str) -> sa.Table:
         sa.Column("index", sa.INTEGER(), nullable=False, primary_key=True),
         sa.Column("uid", sa.TEXT(), nullable=False, unique=True),
         sa.Column("name", sa.TEXT(), nullable=False),
+        sa.Column("schema_fingerprint", sa.TEXT(), nullable=True),
+        sa.Column("schema_objects", postgresql.JSONB(), nullable=True),
     )
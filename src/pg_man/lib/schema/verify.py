@@ -0,0 +1,265 @@
+from dataclasses import dataclass
+from collections.abc import Sequence
+from pathlib import Path
+import functools
+import hashlib
+import logging
+import tempfile
+import parse
+import sqlalchemy as sa
+from pg_man.config import Settings
+from pg_man.lib import pg
+from pg_man.lib.schema import autogenerate, ddl, revisions
+
+logger = logging.getLogger("dbman.verify")
+
+CHECKPOINT_NAME_FMT = "pgman_ckpt_{index:04d}_{digest}"
+
+_CHECKPOINTS_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS pgman_checkpoint (
+    name TEXT PRIMARY KEY,
+    roles TEXT[] NOT NULL
+)
+"""
+
+
+@dataclass(frozen=True)
+class Checkpoint:
+    """Template database holding the schema after revision ``index``."""
+
+    index: int
+    digest: str
+
+    @property
+    def name(self) -> str:
+        return CHECKPOINT_NAME_FMT.format(index=self.index, digest=self.digest)
+
+
+def cumulative_digests(revs: Sequence[revisions.Revision]) -> list[str]:
+    """Return, for each revision, a hash of its filename and content chained
+    with those of every revision before it."""
+    h = hashlib.sha256()
+    digests = []
+    for rev in revs:
+        h.update(rev.path.name.encode())
+        h.update(b"\0")
+        h.update(rev.content.encode())
+        digests.append(h.hexdigest()[:16])
+
+    return digests
+
+
+def verify_revisions(
+    settings: Settings,
+    ddl_repo: ddl.DDLRepo,
+    revisions_repo: revisions.RevisionRepo,
+    *,
+    checkpoint_interval: int,
+) -> str:
+    """Replay every revision and diff the result against ``ddl_repo``.
+
+    Replay happens on a persistent cluster in ``settings.verify_cache_dir``,
+    which keeps a template database every ``checkpoint_interval`` revisions.
+    Replay starts from a clone of the newest checkpoint whose digest still
+    matches the revision history. Returns the DDL needed to go from the
+    replayed schema to the declared one; empty if they agree.
+
+    Of the cluster-wide objects revisions may create, only roles are tracked
+    (see :func:`_prepare_start`); tablespaces are not supported.
+    """
+    if checkpoint_interval < 1:
+        raise ValueError("checkpoint_interval must be positive")
+
+    revs = revisions_repo.revisions
+    digests = cumulative_digests(revs)
+    wanted = {
+        Checkpoint(index, digests[index])
+        for index in range(checkpoint_interval - 1, len(revs), checkpoint_interval)
+    }
+
+    settings.verify_cache_dir.mkdir(parents=True, exist_ok=True)
+
+    with (
+        tempfile.TemporaryDirectory() as tmpdir,
+        pg.PostgresProcess(
+            settings.postgres_path, data_dir=settings.verify_cache_dir / "data"
+        ) as pg_proc,
+    ):
+        base_url = sa.make_url(pg_proc.url()).set(drivername="postgresql+psycopg")
+        admin_engine = sa.create_engine(
+            base_url, poolclass=sa.NullPool, isolation_level="AUTOCOMMIT"
+        )
+
+        with admin_engine.connect() as admin:
+            _drop_leftover_databases(admin, base_url)
+            start = _prepare_start(admin, base_url, wanted)
+            if start is not None:
+                logger.info("Replaying from checkpoint %s", start.name)
+
+            with pg.TemporaryDatabase(
+                base_url, template_name=start.name if start else None
+            ) as replay_db:
+                replay_engine = replay_db.connect()
+
+                pending = sorted(
+                    (c for c in wanted if start is None or c.index > start.index),
+                    key=lambda c: c.index,
+                )
+                for checkpoint in pending:
+                    with replay_engine.connect() as conn:
+                        revisions_repo.upgrade_db(conn, target=revs[checkpoint.index])
+                        conn.commit()
+
+                    _checkpoint_db(
+                        base_url, checkpoint, template=replay_db.name
+                    ).create()
+                    _record_checkpoint(admin, checkpoint)
+                    logger.info("Created checkpoint %s", checkpoint.name)
+
+                with replay_engine.connect() as conn:
+                    revisions_repo.upgrade_db(conn)
+                    conn.commit()
+
+                replay_engine.dispose()
+
+                with pg.TemporaryDatabase(base_url) as ddl_db:
+                    ddl_engine = ddl_db.connect()
+                    with ddl_engine.connect() as conn:
+                        ddl_repo.apply(conn)
+                        conn.commit()
+
+                    ddl_engine.dispose()
+
+                    return autogenerate.diff_databases(
+                        settings,
+                        _libpq_url(replay_db.url()),
+                        _libpq_url(ddl_db.url()),
+                        Path(tmpdir),
+                        sorted(settings.managed_schemas) or None,
+                    )
+
+
+def _drop_leftover_databases(admin: sa.Connection, base_url: sa.URL):
+    # Replay and DDL databases of a run that was killed before cleaning up.
+    names = admin.execute(
+        sa.text("SELECT datname FROM pg_database WHERE datname LIKE 'tempdb\\_%'")
+    ).scalars()
+    for name in list(names):
+        pg.TemporaryDatabase(base_url, name=name).destroy()
+        logger.info("Dropped leftover database %s", name)
+
+
+def _prepare_start(
+    admin: sa.Connection, base_url: sa.URL, wanted: set[Checkpoint]
+) -> Checkpoint | None:
+    """Drop unusable checkpoints and roles, and return the checkpoint to
+    replay from.
+
+    Roles are global to the cluster, so ones created by revisions outlive the
+    replay database. Each checkpoint records the roles that existed when it was
+    taken. Before replaying, every role not recorded for the starting
+    checkpoint is dropped, so revisions after it can create them again.
+    """
+    admin.execute(sa.text(_CHECKPOINTS_TABLE_DDL))
+
+    roles = _roles(admin)
+    existing = _list_checkpoints(admin)
+    usable = {
+        checkpoint: checkpoint_roles
+        for checkpoint, checkpoint_roles in existing.items()
+        if checkpoint in wanted
+        and checkpoint_roles is not None
+        and checkpoint_roles <= roles
+    }
+    for stale in existing.keys() - usable.keys():
+        _drop_checkpoint(admin, base_url, stale)
+
+    start = max(usable, key=lambda c: c.index, default=None)
+    keep = usable[start] if start is not None else frozenset()
+
+    try:
+        _drop_roles(admin, roles - keep)
+    except sa.exc.DBAPIError:
+        # An older checkpoint still depends on one of the roles.
+        logger.info("Checkpoints depend on dropped roles; rebuilding all")
+        for checkpoint in usable:
+            _drop_checkpoint(admin, base_url, checkpoint)
+        _drop_roles(admin, _roles(admin))
+        start = None
+
+    return start
+
+
+def _list_checkpoints(admin: sa.Connection) -> dict[Checkpoint, frozenset[str] | None]:
+    rows = admin.execute(
+        sa.text("""
+            SELECT d.datname, c.roles
+            FROM pg_database d
+            LEFT JOIN pgman_checkpoint c ON c.name = d.datname
+            WHERE d.datname LIKE 'pgman\\_ckpt\\_%'
+        """)
+    ).tuples()
+
+    checkpoints: dict[Checkpoint, frozenset[str] | None] = {}
+    for name, roles in rows:
+        if parsed := _checkpoint_name_parser().parse(name):
+            checkpoint = Checkpoint(parsed["index"], parsed["digest"])
+            checkpoints[checkpoint] = frozenset(roles) if roles is not None else None
+
+    return checkpoints
+
+
+def _record_checkpoint(admin: sa.Connection, checkpoint: Checkpoint):
+    admin.execute(
+        sa.text("""
+            INSERT INTO pgman_checkpoint (name, roles) VALUES (:name, :roles)
+            ON CONFLICT (name) DO UPDATE SET roles = excluded.roles
+        """),
+        {"name": checkpoint.name, "roles": sorted(_roles(admin))},
+    )
+
+
+def _drop_checkpoint(admin: sa.Connection, base_url: sa.URL, checkpoint: Checkpoint):
+    _checkpoint_db(base_url, checkpoint).destroy()
+    admin.execute(
+        sa.text("DELETE FROM pgman_checkpoint WHERE name = :name"),
+        {"name": checkpoint.name},
+    )
+    logger.info("Dropped checkpoint %s", checkpoint.name)
+
+
+def _roles(admin: sa.Connection) -> set[str]:
+    """Roles other than the bootstrap superuser and the predefined ``pg_*``
+    roles, i.e. the ones created by revisions."""
+    return set(
+        admin.execute(
+            sa.text(
+                "SELECT rolname FROM pg_roles"
+                " WHERE oid <> 10 AND rolname NOT LIKE 'pg\\_%'"
+            )
+        ).scalars()
+    )
+
+
+def _drop_roles(admin: sa.Connection, roles: set[str]):
+    preparer = admin.dialect.identifier_preparer
+    for role in sorted(roles):
+        admin.execute(sa.text(f"DROP ROLE {preparer.quote_identifier(role)}"))
+        logger.info("Dropped role %s", role)
+
+
+def _checkpoint_db(
+    base_url: sa.URL, checkpoint: Checkpoint, template: str | None = None
+) -> pg.TemporaryDatabase:
+    return pg.TemporaryDatabase(
+        base_url, name=checkpoint.name, template_name=template, is_template=True
+    )
+
+
+def _libpq_url(url: sa.URL) -> str:
+    return url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+@functools.cache
+def _checkpoint_name_parser() -> parse.Parser:
+    return parse.compile(CHECKPOINT_NAME_FMT)